@@ -1,8 +1,14 @@
 import re
+import json
 import time
+import hashlib
+from pathlib import Path
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from pdf_utils import extract_text
-from text_utils import chunk_text
+from text_utils import extract_relevant_text
 from llm import insurance_decoder
 from risk_engine import calculate_risk_score, AVG_TREATMENT_COST
 
@@ -13,475 +19,12 @@ st.set_page_config(
     layout="wide"
 )
 
-# CSS 
-st.markdown("""
-<style>
-@import url('https://fonts.googleapis.com/css2?family=Playfair+Display:ital,wght@0,400;0,700;0,900;1,400&family=Inter:wght@300;400;500;600&family=JetBrains+Mono:wght@400;600&display=swap');
-
-*, *::before, *::after { box-sizing: border-box; }
-
-html, body,
-[data-testid="stAppViewContainer"],
-[data-testid="stMain"],
-section.main,
-.main .block-container {
-    background-color: #0a0a0f !important;
-}
-
-[data-testid="stSidebar"] { background: #0e0e16 !important; }
-
-html, body, [class*="css"], .stMarkdown, p, li, span, div, label {
-    font-family: 'Inter', sans-serif !important;
-    color: #e8e8f0 !important;
-}
-
-h1, h2, h3 {
-    font-family: 'Inter', sans-serif !important;
-    color: #f5f0e8 !important;
-}
-
-code, pre, .mono {
-    font-family: 'JetBrains Mono', monospace !important;
-}
-
-.stSlider label, .stNumberInput label, .stSelectbox label,
-.stMultiSelect label, .stFileUploader label {
-    color: #a0a0b8 !important;
-    font-size: 0.85rem !important;
-    font-weight: 500 !important;
-    letter-spacing: 0.04em !important;
-    text-transform: uppercase !important;
-}
-
-.stTextInput input, .stNumberInput input,
-.stSelectbox [data-baseweb="select"] div,
-[data-baseweb="input"] input {
-    background: #16161f !important;
-    border: 1px solid #2a2a3d !important;
-    color: #e8e8f0 !important;
-    border-radius: 6px !important;
-}
-
-.stSelectbox [data-baseweb="select"] div { color: #e8e8f0 !important; }
-
-.stSlider [data-testid="stSlider"] div[role="slider"] {
-    background: #7c6af7 !important;
-}
-
-.stFormSubmitButton button, .stButton button {
-    background: linear-gradient(135deg, #7c6af7, #5b8def) !important;
-    border: none !important;
-    color: #fff !important;
-    font-family: 'Inter', sans-serif !important;
-    font-weight: 600 !important;
-    letter-spacing: 0.05em !important;
-    border-radius: 8px !important;
-    padding: 0.7rem 1.4rem !important;
-    transition: opacity 0.2s !important;
-}
-.stFormSubmitButton button:hover, .stButton button:hover {
-    opacity: 0.88 !important;
-}
-
-[data-testid="stExpander"] {
-    background: #13131e !important;
-    border: 1px solid #2a2a3d !important;
-    border-radius: 8px !important;
-}
-[data-testid="stExpander"] summary {
-    color: #c0b8ff !important;
-    font-weight: 600 !important;
-    font-size: 0.9rem !important;
-}
-[data-testid="stExpander"] summary:hover { color: #e0d8ff !important; }
-[data-testid="stExpander"] div[data-testid="stExpanderDetails"] {
-    color: #c8c8d8 !important;
-    background: #13131e !important;
-}
-[data-testid="stExpander"] p, [data-testid="stExpander"] li,
-[data-testid="stExpander"] strong {
-    color: #c8c8d8 !important;
-}
-[data-testid="stExpander"] strong { color: #e8e8f0 !important; }
-[data-testid="stExpander"] hr { border-color: #2a2a3d !important; }
-
-.stProgress > div > div > div {
-    background: linear-gradient(90deg, #7c6af7, #5b8def) !important;
-}
-.stProgress > div > div { background: #1e1e2e !important; }
-
-.stAlert { border-radius: 8px !important; }
-
-.stCaption { color: #606078 !important; font-size: 0.8rem !important; }
-
-#App header
-.app-header {
-    position: relative;
-    overflow: hidden;
-    padding: 3rem 2.5rem 2.5rem;
-    margin-bottom: 2.5rem;
-    border-radius: 16px;
-    background: #0d0d18;
-    border: 1px solid #1e1e30;
-}
-.app-header::before {
-    content: '';
-    position: absolute;
-    top: -80px; right: -80px;
-    width: 380px; height: 380px;
-    border-radius: 50%;
-    background: radial-gradient(circle, rgba(124,106,247,0.18) 0%, transparent 70%);
-    pointer-events: none;
-}
-.app-header::after {
-    content: '';
-    position: absolute;
-    bottom: -60px; left: 30%;
-    width: 260px; height: 260px;
-    border-radius: 50%;
-    background: radial-gradient(circle, rgba(91,141,239,0.12) 0%, transparent 70%);
-    pointer-events: none;
-}
-.app-header-inner {
-    display: grid;
-    grid-template-columns: 1fr auto;
-    align-items: center;
-    gap: 2rem;
-    position: relative;
-    z-index: 1;
-}
-.app-header-title {
-    font-family: 'Inter', sans-serif !important;
-    font-size: 3.2rem;
-    font-weight: 900;
-    color: #f5f0e8 !important;
-    line-height: 1.05;
-    margin: 0 0 0.8rem 0;
-    letter-spacing: -0.01em;
-}
-.app-header-title em {
-    font-style: italic;
-    color: #c0b8ff !important;
-}
-.app-header-sub {
-    font-size: 1rem;
-    color: #8888a8 !important;
-    margin: 0;
-    font-weight: 400;
-    max-width: 500px;
-    line-height: 1.6;
-}
-.header-stats-grid {
-    display: flex;
-    flex-direction: column;
-    gap: 0.6rem;
-    text-align: right;
-}
-.stat-pill-dark {
-    background: rgba(124,106,247,0.12);
-    border: 1px solid rgba(124,106,247,0.3);
-    border-radius: 20px;
-    padding: 5px 14px;
-    font-size: 0.75rem;
-    font-weight: 600;
-    letter-spacing: 0.05em;
-    color: #a8a0e8 !important;
-    text-transform: uppercase;
-    white-space: nowrap;
-}
-.stat-pill-dark strong {
-    color: #c8c0ff !important;
-    font-weight: 700;
-}
-
-Upload zone
-.upload-zone {
-    border: 1.5px dashed #2a2a40;
-    border-radius: 12px;
-    padding: 3.5rem 2rem;
-    text-align: center;
-    background: #0e0e18;
-    margin-top: 1rem;
-    transition: border-color 0.2s;
-}
-.upload-zone:hover { border-color: #7c6af7; }
-.upload-zone-icon {
-    font-size: 2.5rem;
-    margin-bottom: 1rem;
-    display: block;
-    opacity: 0.6;
-}
-.upload-zone-title {
-    font-family: 'Inter', sans-serif;
-    font-size: 1.5rem;
-    color: #e8e8f0 !important;
-    margin-bottom: 0.4rem;
-}
-.upload-zone-sub { font-size: 0.88rem; color: #5a5a78 !important; }
-
-/* ── Section heading ── */
-.section-heading {
-    font-family: 'Inter', sans-serif !important;
-    font-size: 1.55rem;
-    font-weight: 700;
-    color: #f0ecff !important;
-    margin: 2.8rem 0 0.3rem 0;
-    padding-bottom: 0.7rem;
-    border-bottom: 1px solid #1e1e30;
-    letter-spacing: -0.01em;
-}
-.section-sub {
-    font-size: 0.86rem;
-    color: #686888 !important;
-    margin: 0.2rem 0 1.2rem 0;
-    line-height: 1.5;
-}
-
-/* ── Stat row (summary boxes) ── */
-.stat-row {
-    display: grid;
-    grid-template-columns: repeat(4, 1fr);
-    gap: 1rem;
-    margin-bottom: 1.5rem;
-}
-.stat-box {
-    background: #0e0e18;
-    border: 1px solid #1e1e30;
-    border-radius: 12px;
-    padding: 1.6rem 1.2rem;
-    text-align: center;
-    position: relative;
-    overflow: hidden;
-    transition: border-color 0.2s, transform 0.2s;
-}
-.stat-box:hover { border-color: #3a3a5a; transform: translateY(-2px); }
-.stat-box::before {
-    content: '';
-    position: absolute;
-    top: 0; left: 0; right: 0;
-    height: 2px;
-    border-radius: 12px 12px 0 0;
-}
-.stat-box-red::before   { background: #e05568; }
-.stat-box-orange::before { background: #e8903a; }
-.stat-box-yellow::before { background: #d4a820; }
-.stat-box-blue::before  { background: #4a90d9; }
-
-.stat-box-number {
-    font-family: 'Inter', sans-serif !important;
-    font-size: 3rem;
-    font-weight: 700;
-    line-height: 1;
-    margin-bottom: 0.5rem;
-}
-.stat-box-label {
-    font-size: 0.72rem;
-    font-weight: 600;
-    letter-spacing: 0.06em;
-    text-transform: uppercase;
-    color: #5a5a78 !important;
-}
-
-/* ── Risk meter ── */
-.meter-wrap {
-    position: relative;
-    height: 8px;
-    border-radius: 4px;
-    background: linear-gradient(to right, #27ae60, #f39c12, #e05568);
-    margin: 0.8rem 0 0.3rem;
-}
-.meter-needle {
-    position: absolute;
-    top: -7px;
-    width: 2px;
-    height: 22px;
-    background: #ffffff;
-    border-radius: 1px;
-    transform: translateX(-50%);
-    box-shadow: 0 0 8px rgba(255,255,255,0.5);
-}
-.meter-labels {
-    display: flex;
-    justify-content: space-between;
-    font-size: 0.7rem;
-    color: #4a4a68 !important;
-    font-weight: 500;
-    letter-spacing: 0.04em;
-    text-transform: uppercase;
-    margin-top: 3px;
-}
-
-/* ── Banner ── */
-.banner {
-    padding: 1rem 1.4rem;
-    border-radius: 8px;
-    font-size: 0.93rem;
-    font-weight: 500;
-    margin: 1rem 0;
-    border: 1px solid;
-    line-height: 1.5;
-}
-.banner strong { font-weight: 700; }
-.banner-red    { background: rgba(224,85,104,0.12); border-color: rgba(224,85,104,0.4); color: #f0a0a8 !important; }
-.banner-red strong { color: #f5b8be !important; }
-.banner-orange { background: rgba(232,144,58,0.12); border-color: rgba(232,144,58,0.4); color: #f0b878 !important; }
-.banner-orange strong { color: #f5c898 !important; }
-.banner-green  { background: rgba(39,174,96,0.12);  border-color: rgba(39,174,96,0.4);  color: #80c898 !important; }
-.banner-green strong { color: #a0d8b0 !important; }
-
-/* ── Cards ── */
-.card {
-    border-radius: 10px;
-    padding: 1.1rem 1.4rem;
-    margin-bottom: 0.8rem;
-    border-left: 3px solid;
-    position: relative;
-    transition: transform 0.15s;
-}
-.card:hover { transform: translateX(3px); }
-.card-red    { background: rgba(224,85,104,0.08);  border-color: #e05568; }
-.card-orange { background: rgba(232,144,58,0.08);  border-color: #e8903a; }
-.card-yellow { background: rgba(212,168,32,0.08);  border-color: #d4a820; }
-.card-blue   { background: rgba(74,144,217,0.08);  border-color: #4a90d9; }
-.card-green  { background: rgba(39,174,96,0.08);   border-color: #27ae60; }
-
-.card-label {
-    font-size: 0.65rem;
-    font-weight: 700;
-    letter-spacing: 0.1em;
-    text-transform: uppercase;
-    margin-bottom: 0.4rem;
-    font-family: 'JetBrains Mono', monospace !important;
-}
-.label-red    { color: #e05568 !important; }
-.label-orange { color: #e8903a !important; }
-.label-yellow { color: #d4a820 !important; }
-.label-blue   { color: #4a90d9 !important; }
-.label-green  { color: #27ae60 !important; }
-
-.card-title {
-    font-family: 'Inter', sans-serif !important;
-    font-size: 1.02rem;
-    font-weight: 700;
-    color: #f0ecff !important;
-    margin-bottom: 0.3rem;
-    line-height: 1.35;
-}
-.card-text {
-    font-size: 0.88rem;
-    color: #8888a8 !important;
-    line-height: 1.65;
-}
-
-/* ── Simulator section ── */
-.sim-header {
-    position: relative;
-    overflow: hidden;
-    background: linear-gradient(135deg, #100e1e 0%, #13101f 50%, #0e1220 100%);
-    border: 1px solid #2a2240;
-    border-radius: 16px;
-    padding: 2.5rem 2.5rem;
-    margin: 3rem 0 1.8rem 0;
-}
-.sim-header::before {
-    content: '';
-    position: absolute;
-    top: -50px; right: -50px;
-    width: 280px; height: 280px;
-    border-radius: 50%;
-    background: radial-gradient(circle, rgba(124,106,247,0.15) 0%, transparent 70%);
-    pointer-events: none;
-}
-.sim-header-tag {
-    display: inline-block;
-    background: rgba(124,106,247,0.15);
-    border: 1px solid rgba(124,106,247,0.35);
-    border-radius: 20px;
-    padding: 4px 14px;
-    font-size: 0.7rem;
-    font-weight: 700;
-    letter-spacing: 0.1em;
-    text-transform: uppercase;
-    color: #c0b8ff !important;
-    font-family: 'JetBrains Mono', monospace !important;
-    margin-bottom: 1rem;
-    position: relative;
-    z-index: 1;
-}
-.sim-header h2 {
-    font-family: 'Inter', sans-serif !important;
-    font-size: 2rem !important;
-    font-weight: 700 !important;
-    color: #f5f0e8 !important;
-    margin: 0 0 0.6rem 0 !important;
-    line-height: 1.2;
-    position: relative;
-    z-index: 1;
-}
-.sim-header p {
-    color: #686888 !important;
-    font-size: 0.93rem !important;
-    margin: 0 !important;
-    line-height: 1.6;
-    max-width: 580px;
-    position: relative;
-    z-index: 1;
-}
-
-/* ── Result boxes (Phase 2) ── */
-.result-row {
-    display: grid;
-    grid-template-columns: repeat(3, 1fr);
-    gap: 1rem;
-    margin-bottom: 1.5rem;
-}
-.result-box {
-    background: #0e0e18;
-    border: 1px solid #1e1e30;
-    border-radius: 12px;
-    padding: 1.8rem 1.2rem;
-    text-align: center;
-    position: relative;
-    overflow: hidden;
-}
-.result-box::after {
-    content: '';
-    position: absolute;
-    bottom: 0; left: 0; right: 0;
-    height: 1px;
-}
-.result-number {
-    font-family: 'Inter', sans-serif  !important;
-    font-size: 2.8rem;
-    font-weight: 700;
-    line-height: 1;
-    margin-bottom: 0.5rem;
-}
-.result-label {
-    font-size: 0.7rem;
-    font-weight: 600;
-    letter-spacing: 0.06em;
-    text-transform: uppercase;
-    color: #5a5a78 !important;
-}
-
-/* ── Footer ── */
-.footer-text {
-    font-size: 0.76rem;
-    color: #3a3a58 !important;
-    text-align: center;
-    padding: 2rem 0 1rem;
-    border-top: 1px solid #1a1a28;
-    line-height: 1.7;
-    margin-top: 3rem;
-}
-
-footer { visibility: hidden; }
-#MainMenu { visibility: hidden; }
-.stDeployButton { display: none; }
-[data-testid="collapsedControl"] { display: none; }
+# CSS
+@st.cache_data(show_spinner=False)
+def load_css() -> str:
+    return (Path(__file__).parent / "static" / "app.css").read_text(encoding="utf-8")
 
-""", unsafe_allow_html=True)
+st.markdown(f"<style>\n{load_css()}</style>", unsafe_allow_html=True)
 
 
 def safe_dict(item):
@@ -506,59 +49,122 @@ def meter(score: int):
     <div class="meter-labels"><span>Safe</span><span>Moderate</span><span>High Risk</span></div>
     """, unsafe_allow_html=True)
 
-def card(label: str, color: str, title: str, body: str):
-    st.markdown(f"""
+def card_html(label: str, color: str, title: str, body: str) -> str:
+    # Streamlit dedents the markdown body by its common indent; a newline in
+    # LLM text would drop that to zero and turn the indented HTML into a code block
+    title = str(title).replace("\n", " ")
+    body = str(body).replace("\n", " ") if body else ""
+    return f"""
     <div class="card card-{color}">
         <div class="card-label label-{color}">{label}</div>
         <div class="card-title">{title}</div>
         {"<div class='card-text'>" + body + "</div>" if body else ""}
     </div>
-    """, unsafe_allow_html=True)
+    """
+
+def card(label: str, color: str, title: str, body: str):
+    st.markdown(card_html(label, color, title, body), unsafe_allow_html=True)
+
+def render_cards(cards: list[str]):
+    # One element per list of cards instead of one per card
+    if cards:
+        st.markdown("".join(cards), unsafe_allow_html=True)
 
 def section(title: str, subtitle: str = ""):
     st.markdown(f'<div class="section-heading">{title}</div>', unsafe_allow_html=True)
     if subtitle:
         st.markdown(f'<div class="section-sub">{subtitle}</div>', unsafe_allow_html=True)
 
-def deduplicate(items):
+_SEV_RANK = {"Critical": 3, "High": 2, "Medium": 1}
+_TREATMENT_OPTIONS = list(AVG_TREATMENT_COST.keys())
+
+def dedup_key(item):
+    # Strings and numbers are their own key; dicts use canonical JSON which,
+    # unlike str(dict), ignores the order the LLM emitted the keys in
+    if isinstance(item, (str, int, float)):
+        return item
+    return json.dumps(item, sort_keys=True, default=str)
+
+def deduplicate(items, key=dedup_key):
     seen, out = set(), []
+    seen_add, out_append = seen.add, out.append
     for item in items:
-        k = str(item)
+        k = key(item)
         if k not in seen:
-            seen.add(k); out.append(item)
+            seen_add(k); out_append(item)
     return out
 
 
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+# Streamlit reruns the script on every widget change; cache by content hash
+# ("_" args are skipped by Streamlit's hasher) so reruns skip PDF + LLM work.
+@st.cache_data(show_spinner=False, max_entries=32)
+def _extract_cached(file_hash: str, _uploaded_file) -> str:
+    return extract_text(_uploaded_file)
+
+class _NoResult(Exception):
+    """Raised inside _decode_cached so a failed analysis is not cached."""
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def _decode_cached(text_hash: str, _text: str):
+    # st.cache_data would also cache None; exceptions are never cached
+    result = insurance_decoder(_text)
+    if result is None:
+        raise _NoResult
+    return result
+
+
+_COPAY_RE      = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+# Case-insensitive keyword tests, so the text is never lowercased
+_ROOM_RENT_RE  = re.compile(r"(?=.*?room)(?=.*?rent)", re.I | re.S)
+_DEDUCTIBLE_RE = re.compile(r"deductible|excess", re.I)
+# The first figure anywhere in the text, with or without a currency prefix
+_AMOUNT_RE     = re.compile(r"(?:rs\.?|inr|rupees?)?\s*(\d[\d,]*)", re.I)
+_NO_COMMA      = str.maketrans("", "", ",")
+
+# Pure string -> amount helpers, memoised since reruns re-parse the same items
+@lru_cache(maxsize=512)
+def _copay_from_str(raw: str) -> float | None:
+    match = _COPAY_RE.search(raw)
+    return float(match.group(1)) / 100 if match else None
+
+def _amount_from_str(text: str) -> float | None:
+    match = _AMOUNT_RE.search(text)
+    return float(match.group(1).translate(_NO_COMMA)) if match else None
+
+@lru_cache(maxsize=512)
+def _room_rent_from_str(text: str) -> float | None:
+    return _amount_from_str(text) if _ROOM_RENT_RE.match(text) else None
+
+@lru_cache(maxsize=512)
+def _deductible_from_str(text: str) -> float | None:
+    return _amount_from_str(text) if _DEDUCTIBLE_RE.search(text) else None
+
 def parse_copay_pct(copayments: list) -> float:
-    """Extract numeric co-payment % from LLM output. Returns 0.0 if not found."""
+    """Extract numeric co-payment % from normalised LLM output. Returns 0.0 if not found."""
     for cp in copayments:
-        cp = safe_dict(cp)
         raw = cp.get("percentage") or cp.get("value", "")
-        match = re.search(r"(\d+(?:\.\d+)?)\s*%", str(raw))
-        if match:
-            return float(match.group(1)) / 100
+        pct = _copay_from_str(str(raw))
+        if pct is not None:
+            return pct
     return 0.0
 
 def parse_room_rent(hidden_limits: list) -> float:
     """Look for room rent cap in hidden limits. Returns 0 if not found."""
     for hl in hidden_limits:
-        hl = safe_dict(hl)
-        text = str(hl.get("limit", "") or hl.get("value", "")).lower()
-        if "room" in text and "rent" in text:
-            match = re.search(r"(?:rs\.?|inr|rupees?)?\s*(\d[\d,]*)", text)
-            if match:
-                return float(match.group(1).replace(",", ""))
+        amount = _room_rent_from_str(str(hl.get("limit", "") or hl.get("value", "")))
+        if amount is not None:
+            return amount
     return 0.0
 
 def parse_deductible(hidden_limits: list) -> float:
     """Look for deductible in hidden limits. Returns 0 if not found."""
     for hl in hidden_limits:
-        hl = safe_dict(hl)
-        text = str(hl.get("limit", "") or hl.get("value", "")).lower()
-        if "deductible" in text or "excess" in text:
-            match = re.search(r"(?:rs\.?|inr|rupees?)?\s*(\d[\d,]*)", text)
-            if match:
-                return float(match.group(1).replace(",", ""))
+        amount = _deductible_from_str(str(hl.get("limit", "") or hl.get("value", "")))
+        if amount is not None:
+            return amount
     return 0.0
 
 
@@ -597,52 +203,77 @@ if not uploaded_file:
     """, unsafe_allow_html=True)
     st.stop()
 
-# Extract text
-with st.spinner("Reading policy document..."):
-    try:
-        text = extract_text(uploaded_file)
-    except Exception as e:
-        st.error(f"Could not read the PDF: {e}")
+file_hash  = content_hash(uploaded_file.getvalue())
+phase1_key = f"phase1_{file_hash}"
+
+# Phase 1 results are kept per file in session state, so reruns triggered by
+# the risk form skip extraction, the LLM loop and its progress UI entirely
+if phase1_key in st.session_state:
+    (all_alerts, waiting_periods, exclusions,
+     copayments, hidden_limits, llm_avg_risk) = st.session_state[phase1_key]
+else:
+    # Extract text
+    with st.spinner("Reading policy document..."):
+        try:
+            text = _extract_cached(file_hash, uploaded_file)
+        except Exception as e:
+            st.error(f"Could not read the PDF: {e}")
+            st.stop()
+
+    if not text or len(text.strip()) < 200:
+        st.error("No readable text found. This may be a scanned PDF. Please use a text-based PDF.")
         st.stop()
 
-if not text or len(text.strip()) < 200:
-    st.error("No readable text found. This may be a scanned PDF. Please use a text-based PDF.")
-    st.stop()
+    # LLM analysis
+    all_alerts, waiting_periods, exclusions = [], [], []
+    copayments, hidden_limits, llm_risk_scores = [], [], []
 
-chunks = chunk_text(text, chunk_size=3000, overlap=200)
+    st.markdown("""
+    <div style="font-size:0.78rem;font-weight:600;letter-spacing:0.08em;text-transform:uppercase;
+                color:#6868a8;margin-bottom:0.5rem;font-family:'JetBrains Mono',monospace">
+        Step 1 of 2 — Reading Policy Document
+    </div>
+    """, unsafe_allow_html=True)
+    progress_bar = st.progress(0)
+    status_slot  = st.empty()
 
-# LLM analysis
-all_alerts, waiting_periods, exclusions = [], [], []
-copayments, hidden_limits, llm_risk_scores = [], [], []
+    def phase1_status(label: str, pct: float):
+        status_slot.markdown(
+            f'<div style="font-size:0.82rem;color:#5858888;font-family:\'JetBrains Mono\',monospace">'
+            f'{label}</div>',
+            unsafe_allow_html=True
+        )
+        progress_bar.progress(pct)
+
+    # Keep only the risk-relevant clauses and analyse them in one pass;
+    # insurance_decoder splits the text itself if it is still too long
+    phase1_status("Extracting policy structure...", 0.0)
+    filtered_text, filter_stats = extract_relevant_text(text)
+    scan_label = (
+        f"Scanning {filter_stats.selected_paragraphs} relevant clauses for exclusions, "
+        f"waiting periods and limits..."
+    )
+    phase1_status(scan_label, 0.3)
 
-st.markdown("""
-<div style="font-size:0.78rem;font-weight:600;letter-spacing:0.08em;text-transform:uppercase;
-            color:#6868a8;margin-bottom:0.5rem;font-family:'JetBrains Mono',monospace">
-    Step 1 of 2 — Reading Policy Document
-</div>
-""", unsafe_allow_html=True)
-progress_bar = st.progress(0)
-status_slot  = st.empty()
-
-PHASE1_STEPS = [
-    "Extracting policy structure...",
-    "Scanning for exclusions...",
-    "Identifying waiting periods...",
-    "Checking co-payment clauses...",
-    "Detecting hidden sub-limits...",
-    "Flagging critical risk alerts...",
-    "Scoring overall policy risk...",
-    "Finalising analysis...",
-]
-
-for i, chunk in enumerate(chunks):
-    step_label = PHASE1_STEPS[min(i, len(PHASE1_STEPS) - 1)]
-    status_slot.markdown(
-        f'<div style="font-size:0.82rem;color:#5858888;font-family:\'JetBrains Mono\',monospace">'
-        f'{step_label}</div>',
-        unsafe_allow_html=True
+    # Run the LLM on a worker thread (with this session's script context, so
+    # st.cache_data works there) and keep the progress UI moving while it waits.
+    # shutdown(wait=False) lets a rerun abandon the wait without blocking on it.
+    executor = ThreadPoolExecutor(
+        max_workers=1, initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx())
     )
-    result = insurance_decoder(chunk)
+    future = executor.submit(_decode_cached, content_hash(filtered_text.encode()), filtered_text)
+    executor.shutdown(wait=False)
+    started = time.monotonic()
+    while not wait([future], timeout=0.5).done:
+        elapsed = time.monotonic() - started
+        # Eases towards 95% without knowing how long the model will take
+        phase1_status(f"{scan_label} ({elapsed:.0f}s)", 0.3 + 0.65 * elapsed / (elapsed + 30))
+    try:
+        result = future.result()
+    except _NoResult:
+        result = None
+    progress_bar.progress(1.0)
+
     if result:
         s = result.get("risk_score", 0)
         if isinstance(s, (int, float)) and 0 <= s <= 100:
@@ -652,28 +283,27 @@ for i, chunk in enumerate(chunks):
         exclusions.extend(result.get("exclusions", []))
         copayments.extend(result.get("co_payment", []))
         hidden_limits.extend(result.get("hidden_limits", []))
-    progress_bar.progress((i + 1) / len(chunks))
 
-status_slot.markdown(
-    '<div style="font-size:0.82rem;color:#27ae60;font-family:\'JetBrains Mono\',monospace">'
-    'Analysis complete.</div>',
-    unsafe_allow_html=True
-)
-import time; time.sleep(0.6)
-progress_bar.empty()
-status_slot.empty()
-
-waiting_periods = deduplicate(waiting_periods)
-exclusions      = deduplicate(exclusions)
-copayments      = deduplicate(copayments)
-hidden_limits   = deduplicate(hidden_limits)
-all_alerts      = deduplicate(all_alerts)
-
-if not llm_risk_scores and not exclusions and not waiting_periods and not all_alerts:
-    st.error("Could not extract data from the policy. Please check that the PDF has readable text.")
-    st.stop()
+    progress_bar.empty()
+    status_slot.empty()
+
+    # Deduplicate, then normalise every item to a dict once so the code below
+    # can use plain .get() lookups
+    waiting_periods, exclusions, copayments, hidden_limits, all_alerts = (
+        [safe_dict(item) for item in deduplicate(items)]
+        for items in (waiting_periods, exclusions, copayments, hidden_limits, all_alerts)
+    )
+
+    if not llm_risk_scores and not exclusions and not waiting_periods and not all_alerts:
+        st.error("Could not extract data from the policy. Please check that the PDF has readable text.")
+        st.stop()
+
+    llm_avg_risk = int(sum(llm_risk_scores) / len(llm_risk_scores)) if llm_risk_scores else 50
 
-llm_avg_risk = int(sum(llm_risk_scores) / len(llm_risk_scores)) if llm_risk_scores else 50
+    st.session_state[phase1_key] = (
+        all_alerts, waiting_periods, exclusions,
+        copayments, hidden_limits, llm_avg_risk,
+    )
 
 # Auto-extract policy parameters from LLM output
 extracted_copay       = parse_copay_pct(copayments)
@@ -719,61 +349,63 @@ else:
     st.markdown('<div class="banner banner-green"><strong>Relatively Safe Policy.</strong> Fewer hidden traps than average. Still review the sections below.</div>', unsafe_allow_html=True)
 
 
-all_alerts = sorted(
-    all_alerts,
-    key=lambda x: {"Critical": 3, "High": 2, "Medium": 1}.get(
-        safe_dict(x).get("severity", "Medium"), 0),
+all_alerts.sort(
+    key=lambda x: _SEV_RANK.get(x.get("severity", "Medium"), 0),
     reverse=True
 )
 
 if all_alerts:
     section("Critical Alerts", "The most alarming flags found in your policy document.")
-    for alert in all_alerts:
-        a   = safe_dict(alert)
+    cards = []
+    for a in all_alerts:
         msg = a.get("message") or a.get("value", "")
         sev = a.get("severity", "Medium")
         if not msg: continue
         if sev == "Critical":
-            card("Critical Alert", "red", msg, "")
+            cards.append(card_html("Critical Alert", "red", msg, ""))
         elif sev == "High":
-            card("Important", "orange", msg, "")
+            cards.append(card_html("Important", "orange", msg, ""))
         else:
-            card("Note", "blue", msg, "")
+            cards.append(card_html("Note", "blue", msg, ""))
+    render_cards(cards)
 
 if waiting_periods:
     section(
         "Waiting Period Traps",
         "During these periods your claim will be rejected; even though you are paying the premium every month."
     )
+    cards = []
     for wp in waiting_periods:
-        wp        = safe_dict(wp)
         condition = wp.get("condition") or wp.get("value", "Some conditions")
         duration  = wp.get("duration", "")
         impact    = wp.get("impact", "")
         title     = f"No coverage for {condition}" + (f" — {duration}" if duration else "")
         body      = impact or f"Any claim for {condition} during this waiting period will be rejected. You pay the full hospital bill yourself."
-        card("Waiting Period", "orange", title, body)
+        cards.append(card_html("Waiting Period", "orange", title, body))
+    render_cards(cards)
 
 if exclusions:
     section(
         "Treatments Not Covered",
         "If you are treated for any of these, you pay 100% from your own pocket. Insurance will not help."
     )
-    cols = st.columns(2)
-    for i, ex in enumerate(exclusions):
-        ex     = safe_dict(ex)
+    cards = []
+    for ex in exclusions:
         item   = ex.get("item") or ex.get("value", "Treatment")
         impact = ex.get("impact", "You will have to pay the full cost yourself.")
-        with cols[i % 2]:
-            card("Not Covered", "red", item, impact)
+        cards.append(card_html("Not Covered", "red", item, impact))
+    cols = st.columns(2)
+    for i, col in enumerate(cols):
+        with col:
+            render_cards(cards[i::2])
 
 if copayments:
     section(
         "Times You Pay Extra",
         "Even after insurance pays, you still pay a share of the bill. This is called a co-payment."
     )
+    cards = []
     for cp in copayments:
-        cp      = safe_dict(cp)
         pct     = cp.get("percentage") or cp.get("value", "A percentage")
         cond    = cp.get("condition", "")
         impact  = cp.get("impact", "")
@@ -781,22 +413,24 @@ if copayments:
         body    = (f"When: {cond}. " if cond else "") + (
             impact or f"Example: On a Rs. 1 lakh bill, you pay {pct} directly to the hospital."
         )
-        card("Co-payment", "yellow", title, body)
+        cards.append(card_html("Co-payment", "yellow", title, body))
+    render_cards(cards)
 
 if hidden_limits:
     section(
         "Hidden Coverage Limits",
         "Your policy has a headline amount; but pays much less for specific treatments."
     )
+    cards = []
     for hl in hidden_limits:
-        hl         = safe_dict(hl)
         limit      = hl.get("limit") or hl.get("value", "A limit exists")
         applies_to = hl.get("applies_to", "")
         impact     = hl.get("impact", "")
         body       = (f"Applies to: {applies_to}. " if applies_to else "") + (
             impact or "Even if your total cover is higher, this specific limit means you pay the difference."
         )
-        card("Hidden Limit", "blue", limit, body)
+        cards.append(card_html("Hidden Limit", "blue", limit, body))
+    render_cards(cards)
 
 st.markdown("""
 <div class="sim-header">
@@ -836,7 +470,7 @@ with st.form("risk_form"):
         )
         declared_diseases = st.multiselect(
             "Define Pre-existing Conditions",
-            options=list(AVG_TREATMENT_COST.keys()),
+            options=_TREATMENT_OPTIONS,
             default=[],
             help="We will cross-check these against the waiting periods found in your policy."
         )
@@ -856,12 +490,11 @@ if submitted:
     p2_bar    = st.progress(0)
     p2_status = st.empty()
 
+    # Steps mark real work boundaries; no artificial delays
     PHASE2_STEPS = [
         ("Building your policy profile...",    0.15),
         ("Mapping waiting periods to conditions...", 0.35),
         ("Calculating expected out-of-pocket...", 0.55),
-        ("Computing claim rejection probability...", 0.72),
-        ("Scoring financial exposure...",       0.88),
         ("Generating your report...",           1.0),
     ]
 
@@ -872,15 +505,14 @@ if submitted:
             unsafe_allow_html=True
         )
         p2_bar.progress(pct)
-        time.sleep(0.3)
 
     p2_step(*PHASE2_STEPS[0])
 
-    waiting_names = [
-        safe_dict(wp).get("condition") or safe_dict(wp).get("value", "")
-        for wp in waiting_periods
-        if safe_dict(wp).get("condition") or safe_dict(wp).get("value")
-    ]
+    waiting_names = []
+    for wp in waiting_periods:
+        name = wp.get("condition") or wp.get("value")
+        if name:
+            waiting_names.append(name)
     p2_step(*PHASE2_STEPS[1])
 
     policy = {
@@ -905,15 +537,7 @@ if submitted:
         llm_risk_score=llm_avg_risk,
     )
     p2_step(*PHASE2_STEPS[3])
-    p2_step(*PHASE2_STEPS[4])
-    p2_step(*PHASE2_STEPS[5])
 
-    p2_status.markdown(
-        '<div style="font-size:0.82rem;color:#27ae60;font-family:\'JetBrains Mono\',monospace">'
-        'Simulation complete.</div>',
-        unsafe_allow_html=True
-    )
-    time.sleep(0.5)
     p2_bar.empty()
     p2_status.empty()
 
@@ -972,6 +596,7 @@ if submitted:
             "What This Policy Means for Your Conditions",
         )
         breakdown = risk.get("disease_breakdown", {})
+        cards = []
         for disease in declared_diseases:
             data      = breakdown.get(disease, {})
             cost      = data.get("treatment_cost", 0)
@@ -980,26 +605,27 @@ if submitted:
             shortfall = data.get("sub_limit_shortfall", 0)
 
             if in_wait:
-                card(
+                cards.append(card_html(
                     "Claim Will Be Rejected",
                     "red",
                     f"Your policy will not cover {disease} right now",
                     f"This condition falls under a waiting period. If you are hospitalised for {disease} "
                     f"before it ends, the insurer will reject the claim. You will pay the full "
                     f"{fmt_inr(cost)} yourself."
-                )
+                ))
             else:
                 body = f"Treatment typically costs {fmt_inr(cost)}. "
                 if shortfall > 0:
                     body += f"Sub-limits mean you will still pay roughly {fmt_inr(shortfall)} yourself. "
                 if oop_d > 0:
                     body += f"Over 5 years, your estimated out-of-pocket for {disease} is {fmt_inr(oop_d)}."
-                card(
+                cards.append(card_html(
                     "Covered with out-of-pocket costs",
                     "yellow" if oop_d > 10_000 else "green",
                     f"{disease} is covered by your policy",
                     body
-                )
+                ))
+        render_cards(cards)
 
     st.markdown("<br>", unsafe_allow_html=True)
 
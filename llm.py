@@ -1,31 +1,115 @@
+import os
 import requests
 import json
 import re
+import hashlib
+import functools
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from text_utils import KEYWORD_GROUPS
 
 OLLAMA_URL  = "http://localhost:11434/api/generate"
+MODEL       = "llama3"
 MAX_SINGLE  = 6000   
 
-def call_llm(prompt: str, timeout: int = 180) -> str:
-    """POST to Ollama and return the response string."""
+# Concurrent LLM requests; keep in step with the server's OLLAMA_NUM_PARALLEL
+try:
+    MAX_PARALLEL = max(1, int(os.environ.get("OLLAMA_NUM_PARALLEL", "4")))
+except ValueError:
+    MAX_PARALLEL = 4  # e.g. "" or "auto"
+
+# Chunk batching: at most MAX_BATCH chunks / MAX_BATCH_CHARS chars per call
+MAX_BATCH       = 4
+MAX_BATCH_CHARS = 12000
+
+# Any keyword the paragraph filter scores on; text with none of them cannot
+# yield an extraction, so the LLM is skipped. Spaces also match line breaks.
+_RISK_KW_RE = re.compile(
+    "|".join(
+        re.escape(kw).replace(r"\ ", r"\s+")
+        for _, keywords in KEYWORD_GROUPS.values()
+        for kw in keywords
+    ),
+    re.I,
+)
+
+# On-disk result cache: one JSON file per analysed text, least recently used evicted
+_CACHE_DIR         = Path(__file__).with_name(".llm_cache")
+_CACHE_MAX_ENTRIES = 512
+
+# Hard cap on streamed tokens per call, in case the model never closes its JSON
+MAX_RESPONSE_TOKENS = 4096
+
+# Context window bounds; see _context_size
+MIN_CTX = 2048
+MAX_CTX = 8192
+
+# One pooled keep-alive session shared by every call (and thread)
+_SESSION = requests.Session()
+_SESSION.headers.update({"Connection": "keep-alive"})
+_SESSION.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=16))
+
+
+def _context_size(prompt: str) -> int:
+    """
+    Context window for a prompt: ~3 chars per token plus 1024 tokens for the
+    answer, rounded up to a multiple of MIN_CTX and clamped to MIN_CTX..MAX_CTX.
+
+    The KV cache is sized by num_ctx, so a smaller window is cheaper. Ollama
+    reloads the model when num_ctx changes, so sizes come in coarse steps
+    rather than exact fits.
+    """
+    needed = len(prompt) // 3 + 1024
+    return min(MAX_CTX, max(MIN_CTX, -(-needed // MIN_CTX) * MIN_CTX))
+
+
+def call_llm(prompt: str, timeout: int = 180, key: str = "risk_score") -> str:
+    """
+    POST to Ollama and return the response string.
+
+    The response is streamed, so `timeout` bounds the wait between tokens
+    rather than the whole generation. Reading stops as soon as a JSON object
+    with `key` at its top level is complete; whatever the model would write
+    after it is never generated.
+    """
     try:
-        response = requests.post(
+        with _SESSION.post(
             OLLAMA_URL,
             json={
-                "model": "llama3",
+                "model": MODEL,
                 "prompt": prompt,
-                "stream": False,
+                "stream": True,
                 "options": {
                     # near-deterministic for extraction
                     "temperature": 0.05,  
                     "top_p": 0.9,
-                    # increase context window if model supports it
-                    "num_ctx": 8192,    
+                    # just enough context window for this prompt
+                    "num_ctx": _context_size(prompt),
+                    "num_predict": MAX_RESPONSE_TOKENS,
                 }
             },
-            timeout=timeout
-        )
-        response.raise_for_status()
-        return response.json()["response"]
+            timeout=timeout,
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            watcher = _ObjectWatcher(key)
+            tokens = 0
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise RuntimeError(data["error"])
+                obj = watcher.feed(data.get("response", ""))
+                if obj is not None:
+                    # Leaving the with-block drops the connection, which stops generation
+                    return obj
+                tokens += 1
+                if data.get("done") or tokens >= MAX_RESPONSE_TOKENS:
+                    break
+            return "".join(watcher.text)
     except requests.exceptions.ConnectionError:
         raise RuntimeError("Cannot connect to Ollama. Make sure it is running at http://localhost:11434")
     except requests.exceptions.Timeout:
@@ -35,33 +119,126 @@ def call_llm(prompt: str, timeout: int = 180) -> str:
 
 
 # JSON extractor
-def extract_json(text: str) -> str | None:
-    """Robustly extract the first valid JSON object from LLM output."""
-    clean = re.sub(r"```(?:json)?", "", text).strip()
+_FENCE_RE = re.compile(r"```(?:json)?")
+# The only characters brace matching cares about; "\\" takes the escaped character with it
+_JSON_TOKEN_RE = re.compile(r'\\.?|["{}]', re.DOTALL)
 
-    match = re.search(r"\{.*\}", clean, re.DOTALL)
-    if match:
-        candidate = match.group()
-        try:
-            json.loads(candidate)
-            return candidate
-        except json.JSONDecodeError:
-            pass
 
-    # Substring search fallback
-    for i, ch in enumerate(clean):
-        if ch == "{":
-            for j in range(len(clean), i, -1):
-                try:
-                    json.loads(clean[i:j])
-                    return clean[i:j]
-                except json.JSONDecodeError:
-                    continue
+class _BraceScanner:
+    """
+    Find balanced {...} spans in one left-to-right pass, nested ones included.
+
+    Every "{" may start an object, so a stray brace in prose cannot hide a
+    later one. Whether a brace sits inside a string literal depends on where
+    the object starts, so each open "{" remembers the parity of the quote
+    count before it: a "}" closes the innermost "{" with an even number of
+    quotes since, and any "{" opened after that one is dropped unclosed.
+    """
+
+    def __init__(self):
+        self.open = []                 # offsets of unclosed "{", innermost last
+        self.by_parity = ([], [])      # indexes into open, by quote count at the "{" mod 2
+        self.quotes = 0
+        self.escaped = False           # the previous piece ended with a backslash
+        self.length = 0
+
+    def feed(self, piece: str) -> list[tuple[int, int]]:
+        """Scan piece; return the [start, end) offsets of the spans it closed."""
+        closed = []
+        pos = 1 if self.escaped and piece else 0
+        self.escaped = self.escaped and not piece
+        for token in _JSON_TOKEN_RE.finditer(piece, pos):
+            ch = token.group()
+            if ch[0] == "\\":
+                self.escaped = len(ch) == 1
+            elif ch == '"':
+                self.quotes += 1
+            elif ch == "{":
+                self.by_parity[self.quotes & 1].append(len(self.open))
+                self.open.append(self.length + token.start())
+            else:
+                same = self.by_parity[self.quotes & 1]
+                if not same:
+                    continue  # closes nothing
+                k = same.pop()
+                closed.append((self.open[k], self.length + token.end()))
+                del self.open[k:]
+                other = self.by_parity[1 - (self.quotes & 1)]
+                while other and other[-1] > k:
+                    other.pop()
+        self.length += len(piece)
+        return closed
+
+
+def _iter_json_objects(text: str):
+    """
+    Yield every balanced {...} slice of text, nested ones included, ordered by
+    where they start. Found in one pass; nothing is rescanned.
+    """
+    for start, end in sorted(_BraceScanner().feed(text)):
+        yield text[start:end]
+
+
+def _load_candidate(candidate: str, key: str | None):
+    """Parse one candidate slice; None if it is not JSON or lacks `key` at the top level."""
+    try:
+        parsed = json.loads(candidate)
+    except json.JSONDecodeError:
+        return None
+    if key is not None and not (isinstance(parsed, dict) and key in parsed):
+        return None  # a fragment, e.g. one entry of a truncated answer
+    return parsed
+
+
+def _load_first_json(text: str, key: str | None = None) -> tuple[str, object] | None:
+    """
+    Find the first valid JSON object in LLM output; return (source, parsed value).
+    With `key`, only an object that has that key at its top level counts.
+    """
+    clean = _FENCE_RE.sub("", text).strip()
+
+    for candidate in _iter_json_objects(clean):
+        parsed = _load_candidate(candidate, key)
+        if parsed is not None:
+            return candidate, parsed
     return None
 
 
+class _ObjectWatcher:
+    """Scan streamed text and report when an object with the expected top-level key closes."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.scanner = _BraceScanner()
+        self.text = []      # streamed pieces
+        self.offsets = []   # offset of each piece in the whole text
+
+    def feed(self, piece: str) -> str | None:
+        """Add piece; return the first closed object that parses and has `key`, if any."""
+        self.offsets.append(self.scanner.length)
+        self.text.append(piece)
+        for start, end in self.scanner.feed(piece):
+            candidate = self._slice(start, end)
+            if _load_candidate(candidate, self.key) is not None:
+                return candidate
+        return None
+
+    def _slice(self, start: int, end: int) -> str:
+        """The streamed text's [start, end), joined from only the pieces it spans."""
+        first = bisect_right(self.offsets, start) - 1
+        last = bisect_left(self.offsets, end)
+        base = self.offsets[first]
+        return "".join(self.text[first:last])[start - base:end - base]
+
+
+def extract_json(text: str) -> str | None:
+    """Robustly extract the first valid JSON object from LLM output."""
+    found = _load_first_json(text)
+    return found[0] if found else None
+
+
 # Prompt builder
-_EXTRACTION_PROMPT = """You are a strict Indian health insurance policy analyzer.
+_PROMPT_RULES = """You are a strict Indian health insurance policy analyzer.
 
 TASK: Extract ONLY information explicitly present in the policy clauses below.
 These clauses have already been pre-filtered from a full policy document to contain
@@ -79,9 +256,9 @@ RISK SCORE GUIDE (0–100):
   61–80 : Many exclusions, long waiting periods, or high co-pay — significant risk
   81–100: Extensive exclusions, multiple co-pays, very long waiting periods — high rejection risk
 
-OUTPUT: Respond with ONLY a valid JSON object. No preamble, no explanation, no markdown fences.
+"""
 
-{{
+_PROMPT_SCHEMA = """{{
   "risk_score": <integer 0-100>,
   "waiting_periods": [
     {{"condition": "<name>", "duration": "<e.g. 2 years>", "impact": "<plain English consequence>"}}
@@ -99,34 +276,99 @@ OUTPUT: Respond with ONLY a valid JSON object. No preamble, no explanation, no m
     {{"severity": "<Critical|High|Medium>", "message": "<plain language warning>"}}
   ]
 }}
+"""
+
+_EXTRACTION_PROMPT = _PROMPT_RULES + """OUTPUT: Respond with ONLY a valid JSON object. No preamble, no explanation, no markdown fences.
+
+""" + _PROMPT_SCHEMA + """
+Policy Clauses:
+{text}
+"""
+
+# {text} is the only field, so split once and concatenate per call instead of .format
+# (faster than both str.format and string.Template)
+_PROMPT_HEAD, _PROMPT_TAIL = (
+    _EXTRACTION_PROMPT.replace("{{", "{").replace("}}", "}").split("{text}")
+)
 
+# Several chunks in one call: the rules and schema are sent once per batch
+_BATCH_PROMPT = _PROMPT_RULES + """The policy clauses are split into {n} sections, each starting with a line "### CHUNK <number>".
+Analyse every section separately.
+
+OUTPUT: Respond with ONLY a valid JSON object of the form {{"chunks": [...]}}, where "chunks"
+holds exactly {n} objects, one per section in section order, each with this shape.
+No preamble, no explanation, no markdown fences.
+
+""" + _PROMPT_SCHEMA + """
 Policy Clauses:
 {text}
 """
 
 
+@functools.lru_cache(maxsize=None)
+def _batch_prompt_parts(n: int) -> tuple[str, str]:
+    """_BATCH_PROMPT for n chunks, formatted once and split around {text}."""
+    head, tail = _BATCH_PROMPT.format(n=n, text="{text}").split("{text}")
+    return head, tail
+
+
 def _parse_result(raw: str) -> dict | None:
     """Parse and validate LLM output into a clean dict."""
-    json_string = extract_json(raw)
-    if not json_string:
+    # Parsed once while locating the object; no second json.loads
+    found = _load_first_json(raw, "risk_score")
+    if not found:
         print("WARNING: No JSON found in LLM output.")
         print("RAW PREVIEW:", raw[:400])
         return None
     try:
-        parsed = json.loads(json_string)
-        defaults = {
-            "risk_score": 0,
-            "waiting_periods": [],
-            "exclusions": [],
-            "co_payment": [],
-            "hidden_limits": [],
-            "danger_alerts": [],
-        }
-        defaults.update(parsed)
-        # Clamp risk score
-        defaults["risk_score"] = max(0, min(100, int(defaults["risk_score"])))
-        return defaults
-    except (json.JSONDecodeError, ValueError) as e:
+        return _validated(found[1])
+    except (ValueError, TypeError) as e:
+        print(f"JSON PARSE FAILED: {e}")
+        return None
+
+
+def _validated(parsed) -> dict | None:
+    """
+    _normalise(parsed) if it is a result object (a dict with "risk_score"),
+    else None: a fragment must count as a failed parse, not an empty result.
+    """
+    if not (isinstance(parsed, dict) and "risk_score" in parsed):
+        return None
+    return _normalise(parsed)
+
+
+def _normalise(parsed: dict) -> dict:
+    """Fill missing categories and clamp the risk score."""
+    defaults = {
+        "risk_score": 0,
+        "waiting_periods": [],
+        "exclusions": [],
+        "co_payment": [],
+        "hidden_limits": [],
+        "danger_alerts": [],
+    }
+    defaults.update(parsed)
+    # Clamp risk score
+    defaults["risk_score"] = max(0, min(100, int(defaults["risk_score"])))
+    return defaults
+
+
+def _parse_batch(raw: str, n: int) -> list[dict | None] | None:
+    """
+    Parse a batched response into n per-chunk dicts, or None if malformed.
+    A chunk whose object fails validation comes back as None.
+    """
+    found = _load_first_json(raw, "chunks")
+    if not found:
+        print("WARNING: No JSON found in batched LLM output.")
+        return None
+    try:
+        items = found[1].get("chunks")
+        if not isinstance(items, list) or len(items) != n:
+            print(f"WARNING: Batched LLM output has wrong shape (expected {n} chunks).")
+            return None
+        return [_validated(item) for item in items]
+    except (ValueError, TypeError, AttributeError) as e:
         print(f"JSON PARSE FAILED: {e}")
         return None
 
@@ -144,54 +386,180 @@ def _merge_results(a: dict, b: dict) -> dict:
     return merged
 
 
+def _split_sections(text: str) -> list[str]:
+    """Split text into near-equal sections of at most ~MAX_SINGLE chars at paragraph boundaries."""
+    n = -(-len(text) // MAX_SINGLE)
+    sections, start = [], 0
+    for k in range(1, n):
+        # Find a paragraph boundary near the k-th cut point
+        cut = k * len(text) // n
+        split_at = text.rfind("\n\n", max(start, cut - 500), cut + 500)
+        if split_at == -1:
+            split_at = text.rfind("\n", max(start, cut - 200), cut + 200)
+        if split_at == -1:
+            split_at = cut
+        sections.append(text[start:split_at].strip())
+        start = split_at
+    sections.append(text[start:].strip())
+    return [section for section in sections if section]
+
+
+def _pack_batches(sections: list[str]) -> list[list[str]]:
+    """Greedily pack consecutive sections into batches within MAX_BATCH / MAX_BATCH_CHARS."""
+    batches, current, size = [], [], 0
+    for section in sections:
+        if current and (len(current) >= MAX_BATCH or size + len(section) > MAX_BATCH_CHARS):
+            batches.append(current)
+            current, size = [], 0
+        current.append(section)
+        size += len(section)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _decode_single(text: str) -> dict | None:
+    """Analyse one piece of text with a single LLM call."""
+    raw = call_llm(_PROMPT_HEAD + text.strip() + _PROMPT_TAIL)
+    return _parse_result(raw)
+
+
+def _disk_cache(fn):
+    """
+    Memoise fn(text) -> (dict | None, complete) on disk, keyed by a BLAKE2b
+    hash of the text; the wrapper returns just the dict.
+
+    The hash is salted with the model, the prompts and the splitting limits,
+    so changing any of them invalidates old entries. A result is stored only
+    when it is not None and complete: every section of the text produced a
+    result that passed _validated.
+    """
+    settings = (MODEL, _EXTRACTION_PROMPT, _BATCH_PROMPT, MAX_SINGLE, MAX_BATCH, MAX_BATCH_CHARS)
+    salt = hashlib.blake2b(repr(settings).encode(), digest_size=16).digest()
+
+    def cache_path(text: str) -> Path:
+        key = hashlib.blake2b(text.strip().encode(), digest_size=16, key=salt).hexdigest()
+        return _CACHE_DIR / f"{key}.json"
+
+    @functools.wraps(fn)
+    def wrapper(text: str) -> dict | None:
+        path = cache_path(text)
+        try:
+            result = json.loads(path.read_text(encoding="utf-8"))
+            path.touch()  # mark as recently used
+            return result
+        except (OSError, ValueError):
+            pass
+
+        result, complete = fn(text)
+        if result is not None and complete:
+            try:
+                _CACHE_DIR.mkdir(exist_ok=True)
+                tmp = path.with_suffix(f".{os.getpid()}.tmp")
+                tmp.write_text(json.dumps(result), encoding="utf-8")
+                os.replace(tmp, path)
+                _prune_cache()
+            except OSError as e:
+                print(f"WARNING: Could not write LLM cache: {e}")
+        return result
+
+    def cache_clear() -> None:
+        for entry in _CACHE_DIR.glob("*.json"):
+            entry.unlink(missing_ok=True)
+
+    wrapper.cache_clear = cache_clear
+    return wrapper
+
+
+def _prune_cache() -> None:
+    """Drop the least recently used entries beyond _CACHE_MAX_ENTRIES."""
+    entries = list(_CACHE_DIR.glob("*.json"))
+    if len(entries) <= _CACHE_MAX_ENTRIES:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:len(entries) - _CACHE_MAX_ENTRIES]:
+        entry.unlink(missing_ok=True)
+
+
 # Public API
 def insurance_decoder(filtered_text: str) -> dict | None:
     """
-    Analyse pre-filtered policy text with 1–2 LLM calls.
+    Analyse pre-filtered policy text with as few LLM calls as possible.
 
+    If filtered_text has none of the filter's keywords: no call, None.
     If filtered_text <= MAX_SINGLE chars: 1 call.
-    If filtered_text >  MAX_SINGLE chars: split into 2 halves at a paragraph
-    boundary, run 2 calls, merge results.
+    If filtered_text >  MAX_SINGLE chars: split into sections of at most
+    ~MAX_SINGLE chars at paragraph boundaries, send them several per call
+    (see insurance_decoder_batch), run the calls concurrently and merge.
 
     Returns the same dict shape as before so app.py needs no changes.
+    Results are cached on disk (see _disk_cache).
     """
-    text = filtered_text.strip()
-
-    if not text:
-        return None
-
-    if len(text) <= MAX_SINGLE:
-        # Single call
-        raw = call_llm(_EXTRACTION_PROMPT.format(text=text))
-        return _parse_result(raw)
-
-    else:
-        # Two-call split
-        # Find a paragraph boundary near the midpoint
-        mid = len(text) // 2
-        split_at = text.rfind("\n\n", mid - 500, mid + 500)
-        if split_at == -1:
-            split_at = text.rfind("\n", mid - 200, mid + 200)
-        if split_at == -1:
-            split_at = mid
+    return _decode_text(filtered_text)
 
-        part_a = text[:split_at].strip()
-        part_b = text[split_at:].strip()
 
-        print(f"  [llm] Filtered text too long ({len(text)} chars), splitting into 2 calls.")
-
-        raw_a = call_llm(_EXTRACTION_PROMPT.format(text=part_a))
-        result_a = _parse_result(raw_a) or {}
+@_disk_cache
+def _decode_text(filtered_text: str) -> tuple[dict | None, bool]:
+    """
+    Uncached body of insurance_decoder; also reports whether the result is
+    complete, i.e. every section parsed into a validated result object.
+    """
+    text = filtered_text.strip()
 
-        raw_b = call_llm(_EXTRACTION_PROMPT.format(text=part_b))
-        result_b = _parse_result(raw_b) or {}
+    if not text:
+        return None, False
 
-        if not result_a and not result_b:
-            return None
+    if not _RISK_KW_RE.search(text):
+        print("  [llm] No risk keywords in filtered text, skipping the LLM.")
+        return None, False
 
-        if not result_a:
-            return result_b
-        if not result_b:
-            return result_a
+    if len(text) <= MAX_SINGLE:
+        # Single call; _parse_result only returns validated objects
+        result = _decode_single(text)
+        return result, result is not None
+
+    sections = _split_sections(text)
+    batches = _pack_batches(sections)
+    print(
+        f"  [llm] Filtered text too long ({len(text)} chars), "
+        f"splitting into {len(sections)} sections over {len(batches)} calls."
+    )
+
+    with ThreadPoolExecutor(max_workers=min(len(batches), MAX_PARALLEL)) as executor:
+        all_results = [
+            result
+            for batch_results in executor.map(insurance_decoder_batch, batches)
+            for result in batch_results
+        ]
+    # Sections that failed to parse are left out of the merge
+    results = [result for result in all_results if result]
+
+    if not results:
+        return None, False
+
+    merged = results[0]
+    for result in results[1:]:
+        merged = _merge_results(merged, result)
+    return merged, len(results) == len(all_results)
+
+
+def insurance_decoder_batch(chunks: list[str]) -> list[dict | None]:
+    """
+    Analyse several chunks with a single LLM call.
 
-        return _merge_results(result_a, result_b)
\ No newline at end of file
+    Returns one result per input chunk, in order. If the model does not
+    return one object per chunk, each chunk is decoded individually instead.
+    """
+    if len(chunks) == 1:
+        return [_decode_single(chunks[0])]
+
+    text = "\n\n".join(
+        f"### CHUNK {i + 1}\n{chunk.strip()}" for i, chunk in enumerate(chunks)
+    )
+    head, tail = _batch_prompt_parts(len(chunks))
+    raw = call_llm(head + text + tail, key="chunks")
+    results = _parse_batch(raw, len(chunks))
+    if results is None:
+        print(f"  [llm] Batch of {len(chunks)} chunks failed to parse, decoding individually.")
+        return [_decode_single(chunk) for chunk in chunks]
+    return results
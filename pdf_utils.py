@@ -1,22 +1,31 @@
-import pdfplumber
-import logging
+import pypdfium2 as pdfium
 
-logging.getLogger("pdfminer").setLevel(logging.ERROR)
-
-def extract_text(uploaded_file):
+def iter_pages(uploaded_file):
     """
-    Extract all text from a PDF. Returns empty string if no text found.
+    Yield the text of each PDF page that has any, one page at a time.
     Works with Streamlit UploadedFile objects directly.
     """
-    text = ""
-
     try:
-        with pdfplumber.open(uploaded_file) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+        # Accepts a path, bytes or a seekable file object (read in place, not copied)
+        pdf = pdfium.PdfDocument(uploaded_file)
+        try:
+            for page in pdf:
+                textpage = page.get_textpage()
+                # PDFium ends lines with \r\n; keep the plain \n the filter expects
+                page_text = textpage.get_text_range().replace("\r\n", "\n").replace("\r", "\n")
+                textpage.close()
+                page.close()
+                if page_text.strip():
+                    yield page_text
+        finally:
+            pdf.close()
     except Exception as e:
         raise RuntimeError(f"Failed to read PDF: {e}")
 
-    return text.strip()
\ No newline at end of file
+
+def extract_text(uploaded_file):
+    """
+    Extract all text from a PDF. Returns empty string if no text found.
+    Works with Streamlit UploadedFile objects directly.
+    """
+    return "\n".join(iter_pages(uploaded_file)).strip()
\ No newline at end of file
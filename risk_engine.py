@@ -3,6 +3,7 @@
 # Uses Expected Value, Moral Hazard weighting, and Financial Exposure Ratio
 
 import math
+from bisect import bisect_left
 
 # Source: NHA Health Accounts, IRDAI Annual Reports
 
@@ -19,6 +20,9 @@ AVG_TREATMENT_COST = {
     "Cataract":            55_000,
 }
 
+# (disease, cost) pairs in catalogue order, for the per-disease loops
+_ALL_DISEASES = tuple(AVG_TREATMENT_COST.items())
+
 # Age-adjusted base disease probabilities
 # Based on ICMR epidemiological data
 BASE_DISEASE_PREVALENCE = {
@@ -36,12 +40,13 @@ BASE_DISEASE_PREVALENCE = {
 
 AGE_BANDS = [25, 35, 45, 55, 120]  
 
+# Prevalence row for diseases outside the table
+_DEFAULT_PREVALENCE = (0.05, 0.08, 0.12, 0.18, 0.25)
+
 
 def _age_band_index(age: int) -> int:
-    for i, upper in enumerate(AGE_BANDS):
-        if age <= upper:
-            return i
-    return len(AGE_BANDS) - 1
+    # First band whose upper bound is >= age; ages past the last band use it
+    return min(bisect_left(AGE_BANDS, age), len(AGE_BANDS) - 1)
 
 
 def disease_probability(age: int, disease: str) -> float:
@@ -50,7 +55,7 @@ def disease_probability(age: int, disease: str) -> float:
     For pre-existing conditions (user declared), probability is set to 1.0 (certain cost).
     """
     band = _age_band_index(age)
-    probs = BASE_DISEASE_PREVALENCE.get(disease, [0.05, 0.08, 0.12, 0.18, 0.25])
+    probs = BASE_DISEASE_PREVALENCE.get(disease, _DEFAULT_PREVALENCE)
     return probs[band]
 
 # Expected Out-of-Pocket Calculator
@@ -81,27 +86,32 @@ def expected_out_of_pocket(
     no_rejection_prob = 1.0
     breakdown = {}
 
-    all_diseases = list(set(
-        list(AVG_TREATMENT_COST.keys()) +
-        [d for d in declared_diseases if d in AVG_TREATMENT_COST]
-    ))
-
-    for disease in all_diseases:
-        is_declared = disease in declared_diseases
-        p = 1.0 if is_declared else disease_probability(age, disease)
-        cost = AVG_TREATMENT_COST.get(disease, 100_000)
-
-        # Room rent sub-limit: capped rooms inflate total bill
-        # Rule: if room rent cap < standard, ~40% of total bill may be proportionately reduced
-        room_rent_penalty = 0.0
-        if room_rent_cap is not None:
-            assumed_standard_rent = 5_000 
-            if room_rent_cap < assumed_standard_rent:
-                proportion = room_rent_cap / assumed_standard_rent
-                room_rent_penalty = cost * (1 - proportion) * 0.4  
+    # Every declared disease we can price is already in _ALL_DISEASES
+    declared = frozenset(declared_diseases)
+
+    # Room rent sub-limit: capped rooms inflate total bill
+    # Rule: if room rent cap < standard, ~40% of total bill may be proportionately reduced
+    # The reduced share does not depend on the disease, so work it out once
+    room_rent_factor = 0.0
+    if room_rent_cap is not None:
+        assumed_standard_rent = 5_000 
+        if room_rent_cap < assumed_standard_rent:
+            proportion = room_rent_cap / assumed_standard_rent
+            room_rent_factor = (1 - proportion) * 0.4  
+
+    # Local binds for the loop: the age band is the same for every disease
+    band = _age_band_index(age)
+    get_prevalence = BASE_DISEASE_PREVALENCE.get
+    get_sub_limit = sub_limits.get
+
+    for disease, cost in _ALL_DISEASES:
+        is_declared = disease in declared
+        p = 1.0 if is_declared else get_prevalence(disease, _DEFAULT_PREVALENCE)[band]
+
+        room_rent_penalty = cost * room_rent_factor
 
         # Sub-limit shortfall
-        sub_limit = sub_limits.get(disease, sum_insured)
+        sub_limit = get_sub_limit(disease, sum_insured)
         sub_limit_shortfall = max(0, cost - sub_limit)
 
         # Deductible (flat per claim)
@@ -165,6 +175,9 @@ def financial_exposure_ratio(expected_oop_5yr: float, annual_income: float) -> f
 # Policy Exclusion Density Score
 # Penalizes policies with many exclusions / short waiting periods
 
+# Sigmoid values for raw = 0, 0.5, 1.0, ... 200
+_SIGMOID_LUT = tuple(1 / (1 + math.exp(-0.1 * (i / 2 - 15))) for i in range(401))
+
 def exclusion_density_score(
     num_exclusions: int,
     num_waiting_periods: int,
@@ -179,6 +192,10 @@ def exclusion_density_score(
         num_copayments     * 1.5
     )
     # Sigmoid normalization: maps raw score to (0, 1)
+    # raw is a sum of half-unit weights times counts, so 2*raw is an integer
+    idx = int(raw * 2)
+    if 0 <= idx < len(_SIGMOID_LUT):
+        return _SIGMOID_LUT[idx]
     return 1 / (1 + math.exp(-0.1 * (raw - 15)))
 
 # Final Composite Risk Score
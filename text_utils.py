@@ -1,5 +1,8 @@
 import re
-from typing import NamedTuple
+import hashlib
+import itertools
+import threading
+from dataclasses import dataclass
 
 KEYWORD_GROUPS = {
     # Exclusions — highest weight, most directly actionable
@@ -57,6 +60,13 @@ IMPORTANT_SECTION_HEADERS = [
     r"claim procedure", r"claim process",
 ]
 
+# Numbered headings like "Section 4"
+_NUM_HEADING_RE = re.compile(r"^(section|clause|article|schedule|part)\s+[\dIVXivx]+")
+
+# Paragraph boundaries, and fragments that are only numbers and punctuation
+_PARA_BOUNDARY_RE = re.compile(r"\n{2,}|\n(?=\s*(?:\d+\.|[a-z]\)|•|–|—|\*)\s)")
+_JUNK_RE = re.compile(r"[\d\s\-\.]+")
+
 # How many neighbouring paragraphs to include around a hit paragraph
 CONTEXT_WINDOW = 1   # paragraphs before and after each hit
 
@@ -64,7 +74,102 @@ CONTEXT_WINDOW = 1   # paragraphs before and after each hit
 HEADER_FOLLOWTHROUGH = 8
 
 
-class FilterStats(NamedTuple):
+def _trie_pattern(words) -> str:
+    """
+    Regex matching the longest of `words` at a position, built as a trie so the
+    engine follows one branch per character instead of trying every word.
+    Each word is a sequence of regex atoms (an escaped character, or e.g. ".?").
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for atom in word:
+            node = node.setdefault(atom, {})
+        node[""] = {}   # end of a word
+
+    def build(node) -> str:
+        branches = [atom + build(child) for atom, child in sorted(node.items()) if atom]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # A word may end here, so the longer continuations are optional
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+def _literal_atoms(word: str) -> list[str]:
+    return [re.escape(ch) for ch in word]
+
+
+def _header_atoms(pattern: str) -> list[list[str]]:
+    """
+    Expand one IMPORTANT_SECTION_HEADERS pattern into atom sequences for
+    _trie_pattern: "(is|are)" groups become one word per choice, ".?" stays
+    a single atom, anything else is a literal character.
+    """
+    choices = []
+    for token in re.findall(r"\([^()]*\)|\.\?|.", pattern):
+        if token.startswith("("):
+            choices.append([_literal_atoms(alt) for alt in token[1:-1].split("|")])
+        elif token == ".?":
+            choices.append([[token]])
+        else:
+            choices.append([_literal_atoms(token)])
+    return [[atom for part in combo for atom in part] for combo in itertools.product(*choices)]
+
+
+# All header patterns as one trie-shaped alternation
+_HEADER_RE = re.compile(
+    _trie_pattern(atoms for p in IMPORTANT_SECTION_HEADERS for atoms in _header_atoms(p))
+)
+
+
+# Spellings that score as one keyword: separators are ignored ("co-pay" ==
+# "co pay" == "copay"), and the co-payment family is folded into "copay"
+_KEYWORD_ALIASES = {"copayment": "copay"}
+
+
+def _canonical(kw: str) -> str:
+    key = re.sub(r"[-\s]+", "", kw)
+    return _KEYWORD_ALIASES.get(key, key)
+
+
+# Keyword scanning tables, built once from KEYWORD_GROUPS:
+#   _KEYWORD_ORDER    — canonical keyword -> first position in KEYWORD_GROUPS
+#   _KEYWORD_WEIGHT   — canonical keyword -> its highest group weight (scored once per paragraph)
+#   _KEYWORD_PREFIXES — spelling -> (length, canonical keyword) of every spelling that is a
+#                       prefix of it, itself included
+#   _KEYWORD_RE       — zero-width lookahead, so overlapping keywords are all found
+def _keyword_tables() -> tuple[dict, dict, dict]:
+    order, weight_of = {}, {}
+    spellings = {}
+    for weight, keywords in KEYWORD_GROUPS.values():
+        for kw in keywords:
+            key = _canonical(kw)
+            spellings[kw] = key
+            order.setdefault(key, len(order))
+            weight_of[key] = max(weight_of.get(key, 0.0), weight)
+    prefixes = {
+        kw: [(len(p), spellings[p]) for p in spellings if kw.startswith(p)] for kw in spellings
+    }
+    return order, weight_of, prefixes
+
+
+_KEYWORD_ORDER, _KEYWORD_WEIGHT, _KEYWORD_PREFIXES = _keyword_tables()
+_KEYWORD_RE = re.compile(f"(?=({_trie_pattern(map(_literal_atoms, _KEYWORD_PREFIXES))}))")
+_WORD_CHAR_RE = re.compile(r"\w")
+
+
+# Results of recent extract_relevant_text calls, keyed by (text hash, min_score, max_chars).
+# Filtering is deterministic, so a re-uploaded policy skips the whole pipeline.
+_RESULT_CACHE = {}
+_RESULT_CACHE_SIZE = 64
+_RESULT_CACHE_LOCK = threading.Lock()
+
+
+@dataclass(slots=True, frozen=True)
+class FilterStats:
     total_paragraphs: int
     selected_paragraphs: int
     total_chars: int
@@ -76,145 +181,297 @@ def _split_paragraphs(text: str) -> list[str]:
     """
     Split text into meaningful paragraphs.
     Treats double-newlines, bullet points, and numbered list items as boundaries.
-    Strips very short fragments (likely page headers/footers).
+    Strips very short fragments (likely page headers/footers) and repeated paragraphs.
     """
     # Normalise line endings
     text = text.replace("\r\n", "\n").replace("\r", "\n")
 
-    # Split on double newlines OR numbered list patterns like "1." "2." "a)" "(i)"
-    parts = re.split(r"\n{2,}|(?=\n\s*(?:\d+\.|[a-z]\)|•|–|—|\*)\s)", text)
-
+    # Split on double newlines OR the newline before a list item like "1." "a)" "•"
     paras = []
-    for p in parts:
-        p = p.strip()
-        # Skip very short fragments (page numbers, headers like "Page 3 of 40")
+    seen = set()
+    prev = 0
+    # The appended blank line is a final boundary that closes the last paragraph
+    for m in _PARA_BOUNDARY_RE.finditer(text + "\n\n"):
+        start, prev = prev, m.end()
+        # Skip very short fragments (page numbers, headers like "Page 3 of 40").
+        # Stripping only shortens, so short raw spans are dropped before slicing
+        if m.start() - start < 30:
+            continue
+        p = text[start:m.start()].strip()
         if len(p) < 30:
             continue
         # Skip fragments that are purely numeric or purely whitespace
-        if re.fullmatch(r"[\d\s\-\.]+", p):
+        if _JUNK_RE.fullmatch(p):
             continue
+        # Skip verbatim repeats (running headers, boilerplate restated per section)
+        if p in seen:
+            continue
+        seen.add(p)
         paras.append(p)
 
     return paras
 
 
-def _score_paragraph(para: str) -> float:
+def _normalise(para: str) -> str:
     """
-    Return a relevance score for a paragraph.
-    Higher = more likely to contain policy risk information.
+    Lowercase a paragraph and fold common PDF typography (no-break spaces,
+    en/em dashes, soft hyphens) to the plain characters the keywords use.
     """
     lower = para.lower()
-    score = 0.0
+    # ASCII paragraphs cannot contain any of them; isascii() is O(1)
+    if lower.isascii():
+        return lower
+    return lower.replace("\xa0", " ").replace("\u2013", "-").replace("\u2014", "-").replace("\xad", "")
 
-    for group_name, (weight, keywords) in KEYWORD_GROUPS.items():
-        for kw in keywords:
-            if kw in lower:
-                score += weight
-                # Bonus for exact phrase matches (not just substrings)
-                if re.search(r'\b' + re.escape(kw) + r'\b', lower):
-                    score += weight * 0.3
 
+def _score_paragraphs(lowers: list[str], threshold: float | None = None) -> list[float]:
+    """
+    Return a relevance score for each (already lowercased) paragraph.
+    Higher = more likely to contain policy risk information.
+
+    All paragraphs are scanned as one newline-joined string, so the keyword
+    regex runs once per document rather than once per paragraph. No keyword
+    contains a newline, so matches never straddle two paragraphs, and the
+    newline reads as a word boundary just like the paragraph's own ends.
+
+    With a threshold, scanning a paragraph stops once its score reaches it;
+    that paragraph's score is then a partial sum that is still >= threshold.
+    Scores below the threshold are always exact.
+    """
+    doc = "\n".join(lowers)
+    n = len(doc)
+    word_char = _WORD_CHAR_RE.match
+    search = _KEYWORD_RE.search
+
+    # Per paragraph: canonical keyword -> whether some occurrence is a whole-word match
+    found = [{} for _ in lowers]
+    para_idx = 0
+    para_end = len(lowers[0]) if lowers else 0
+    running = 0.0   # rough score of the current paragraph so far
+    pos = 0
+    while (m := search(doc, pos)) is not None:
+        start = m.start()
+        pos = start + 1
+        # Matches come in order, so walk the paragraph index forward
+        if start > para_end:
+            running = 0.0
+            while start > para_end:
+                para_idx += 1
+                para_end += 1 + len(lowers[para_idx])
+        hits = found[para_idx]
+        at_word_start = start == 0 or not word_char(doc, start - 1)
+        # Every keyword that is a prefix of the longest match also occurs here
+        for length, key in _KEYWORD_PREFIXES[m.group(1)]:
+            seen = hits.get(key)
+            if seen:
+                continue
+            end = start + length
+            whole = at_word_start and (end == n or not word_char(doc, end))
+            if seen is None:
+                running += _KEYWORD_WEIGHT[key]
+            elif not whole:
+                continue
+            hits[key] = whole
+            if whole:
+                running += _KEYWORD_WEIGHT[key] * 0.3
+
+        # Enough signal already: skip to the next paragraph
+        if threshold is not None and running >= threshold and _score_hits(hits) >= threshold:
+            pos = para_end + 1
+
+    return [_score_hits(hits) for hits in found]
+
+
+def _score_hits(hits: dict) -> float:
+    # Add up in KEYWORD_GROUPS order so scores match the per-keyword scan exactly
+    score = 0.0
+    for key in sorted(hits, key=_KEYWORD_ORDER.__getitem__):
+        weight = _KEYWORD_WEIGHT[key]
+        score += weight
+        # Bonus for exact phrase matches (not just substrings)
+        if hits[key]:
+            score += weight * 0.3
     return score
 
 
-def _is_section_header(para: str) -> bool:
+def _is_section_header(para: str, lower: str) -> bool:
     """
     Returns True if this paragraph looks like a section heading that introduces
     an important section (exclusions, waiting periods, etc.).
+    `lower` is _normalise(para); paragraphs are already stripped.
     """
-    lower = para.lower().strip()
 
     # Very long paragraphs are not headers
     if len(para) > 300:
         return False
 
     # Check for important header keywords
-    for pattern in IMPORTANT_SECTION_HEADERS:
-        if re.search(pattern, lower):
-            return True
+    if _HEADER_RE.search(lower):
+        return True
 
     # Also flag ALL-CAPS short lines (common in policy docs for section titles)
-    if para.isupper() and len(para) < 100:
+    # Length first: it is O(1), isupper walks the string
+    if len(para) < 100 and para.isupper():
         return True
 
     # Numbered section headings like "Section 4: Exclusions"
-    if re.match(r"^(section|clause|article|schedule|part)\s+[\dIVXivx]+", lower):
+    if _NUM_HEADING_RE.match(lower):
         return True
 
     return False
 
 
-def extract_relevant_text(text: str, min_score: float = 2.0) -> tuple[str, FilterStats]:
+def _push_range(merged: list[tuple[int, int]], start: int, end: int) -> None:
+    """
+    Add [start, end) to merged, a sorted list of disjoint ranges, folding in any
+    tail ranges it overlaps or touches. Assumes end lies past the start of the
+    last range, which holds when ranges come from a forward scan.
+    """
+    while merged and start <= merged[-1][1]:
+        last_start, last_end = merged.pop()
+        start, end = min(start, last_start), max(end, last_end)
+    merged.append((start, end))
+
+
+def _merge_ranges(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Sort [start, end) ranges and merge any that overlap or touch."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def extract_relevant_text(
+    text: str, min_score: float = 2.0, max_chars: int | None = None
+) -> tuple[str, FilterStats]:
     """
     Main entry point. Returns:
         filtered_text   — concatenated relevant paragraphs, ready for LLM
-        stats           — FilterStats namedtuple for reporting
+        stats           — FilterStats record for reporting
 
     Parameters:
         text        — full extracted PDF text
         min_score   — minimum relevance score for a paragraph to be included
                       directly (neighbours and header followthroughs are always included)
+        max_chars   — optional size budget for filtered_text; the lowest-scoring
+                      blocks are dropped until it fits, then the last block is
+                      trimmed from its weaker end (at least one paragraph is kept)
     """
+    key = (
+        hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest(),
+        min_score,
+        max_chars,
+    )
+    with _RESULT_CACHE_LOCK:
+        cached = _RESULT_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    result = _filter_text(text, min_score, max_chars)
+    with _RESULT_CACHE_LOCK:
+        _RESULT_CACHE[key] = result
+        # Evict oldest first (dicts keep insertion order)
+        while len(_RESULT_CACHE) > _RESULT_CACHE_SIZE:
+            del _RESULT_CACHE[next(iter(_RESULT_CACHE))]
+    return result
+
+
+def _block_chars(offsets: list[int], start: int, end: int) -> int:
+    """Length of paragraphs[start:end] joined with blank lines."""
+    return offsets[end] - offsets[start] + 2 * (end - start - 1)
+
+
+def _joined_chars(offsets: list[int], merged: list[tuple[int, int]]) -> int:
+    """Length of the blocks in merged joined with the 7-character "---" separator."""
+    if not merged:
+        return 0
+    return sum(_block_chars(offsets, start, end) for start, end in merged) + 7 * (len(merged) - 1)
+
+
+def _filter_text(text: str, min_score: float, max_chars: int | None = None) -> tuple[str, FilterStats]:
+    """Uncached body of extract_relevant_text."""
     paragraphs = _split_paragraphs(text)
     n = len(paragraphs)
 
     if n == 0:
         return text, FilterStats(0, 0, len(text), len(text), 0.0)
 
-    # Score every paragraph
-    scores = [_score_paragraph(p) for p in paragraphs]
-
-    # Determine which paragraphs to include
-    include = [False] * n
+    # Normalise once; scoring and header detection both work on it
+    lowers = [_normalise(p) for p in paragraphs]
+    # Scores are only compared against min_score and the 0.5 fallback cut-off,
+    # so stop scoring a paragraph once it clears both. A size budget ranks
+    # blocks by score, so then every paragraph needs its full score.
+    scores = _score_paragraphs(lowers, threshold=None if max_chars is not None else max(min_score, 0.5))
+    # offsets[i] is the total length of paragraphs[:i]
+    offsets = list(itertools.accumulate(map(len, paragraphs), initial=0))
+
+    # Determine which paragraphs to include, as merged half-open [start, end)
+    # ranges built up as the scan goes, so no sort is needed afterwards
+    merged = []
+    # Weak hits, kept for the fallback below. Direct hits are left out: their
+    # context window already covers the fallback's one-paragraph window.
+    low_hits = []
 
     for i, (para, score) in enumerate(zip(paragraphs, scores)):
 
-        # Direct hit — paragraph has enough signal
+        # Direct hit — paragraph has enough signal; include context neighbours
         if score >= min_score:
-            include[i] = True
-            # Include context neighbours
-            for j in range(max(0, i - CONTEXT_WINDOW), min(n, i + CONTEXT_WINDOW + 1)):
-                include[j] = True
+            _push_range(merged, max(0, i - CONTEXT_WINDOW), min(n, i + CONTEXT_WINDOW + 1))
+        elif score >= 0.5:
+            low_hits.append(i)
 
         # Section header — include the header + next N paragraphs
-        if _is_section_header(para):
-            include[i] = True
-            for j in range(i + 1, min(n, i + HEADER_FOLLOWTHROUGH + 1)):
-                include[j] = True
+        if _is_section_header(para, lowers[i]):
+            _push_range(merged, i, min(n, i + HEADER_FOLLOWTHROUGH + 1))
 
     # Safety net: if we captured less than 15% of paragraphs, something is
     # wrong (unusual formatting, scanned text, etc.) — fall back to full text
-    selected_count = sum(include)
-    if selected_count < max(3, int(n * 0.10)):
+    selected_count = sum(end - start for start, end in merged)
+    filtered_chars = _joined_chars(offsets, merged)
+    over_budget = max_chars is not None and filtered_chars > max_chars
+    if selected_count < max(3, int(n * 0.10)) and not over_budget:
         # Fall back: lower threshold and retry
-        for i, score in enumerate(scores):
-            if score >= 0.5:
-                include[i] = True
-                for j in range(max(0, i - 1), min(n, i + 2)):
-                    include[j] = True
-
-    selected_count = sum(include)
-
-    filtered_parts = []
-    prev_included = False
-
-    for i, (para, inc) in enumerate(zip(paragraphs, include)):
-        if inc:
-            if filtered_parts and not prev_included:
-                filtered_parts.append("---")  
-            filtered_parts.append(para)
-            prev_included = True
-        else:
-            prev_included = False
-
-    filtered_text = "\n\n".join(filtered_parts)
+        merged = _merge_ranges(merged + [(max(0, i - 1), min(n, i + 2)) for i in low_hits])
+        selected_count = sum(end - start for start, end in merged)
+        filtered_chars = _joined_chars(offsets, merged)
+
+    if max_chars is not None and filtered_chars > max_chars and len(merged) > 1:
+        # Drop the weakest blocks first, then restore document order
+        kept = sorted(merged, key=lambda r: max(scores[r[0]:r[1]]), reverse=True)
+        while filtered_chars > max_chars and len(kept) > 1:
+            start, end = kept.pop()
+            filtered_chars -= _block_chars(offsets, start, end) + 7
+            selected_count -= end - start
+        merged = sorted(kept)
+
+    if max_chars is not None and filtered_chars > max_chars and merged:
+        # One block left: trim it a paragraph at a time from the lower-scoring end
+        (start, end), = merged
+        while filtered_chars > max_chars and end - start > 1:
+            if scores[start] <= scores[end - 1]:
+                filtered_chars -= len(paragraphs[start]) + 2
+                start += 1
+            else:
+                end -= 1
+                filtered_chars -= len(paragraphs[end]) + 2
+            selected_count -= 1
+        merged = [(start, end)]
+
+    # Merged ranges never touch, so "---" marks each gap between them
+    filtered_text = "\n\n---\n\n".join(
+        "\n\n".join(paragraphs[start:end]) for start, end in merged
+    )
 
     stats = FilterStats(
         total_paragraphs=n,
         selected_paragraphs=selected_count,
         total_chars=len(text),
-        filtered_chars=len(filtered_text),
-        reduction_pct=round((1 - len(filtered_text) / max(len(text), 1)) * 100, 1),
+        filtered_chars=filtered_chars,
+        reduction_pct=round((1 - filtered_chars / max(len(text), 1)) * 100, 1),
     )
 
     return filtered_text, stats
@@ -230,6 +487,8 @@ def chunk_text(text, chunk_size=3000, overlap=200):
             bp = text.rfind('\n', start + chunk_size - 400, end)
             if bp == -1:
                 bp = text.rfind('. ', start + chunk_size - 400, end)
+            if bp == -1:
+                bp = text.rfind(' ', start + chunk_size - 400, end)
             if bp != -1:
                 end = bp + 1
         chunk = text[start:end].strip()